@@ -8,16 +8,33 @@ with patient metadata arranged by rows.
 """
 
 import argparse
+import difflib
+import io
 import logging
 import os
 import re
-import xml.etree.ElementTree as ET
-from collections import defaultdict
+from collections import defaultdict, deque
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 import pandas as pd
 
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:  # pragma: no cover - fallback when lxml is missing
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+try:
+    import xlsxwriter  # noqa: F401 - used as the pandas ExcelWriter engine
+    HAS_XLSXWRITER = True
+except ImportError:  # pragma: no cover - fallback to openpyxl write-only
+    HAS_XLSXWRITER = False
+
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +43,249 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Simple text fields: XML tag -> metadata key
+_TEXT_FIELDS = {
+    'subjectIdentifier': 'subject_id',
+    'researchGroup': 'research_group',
+    'subjectSex': 'gender',
+    'subjectAge': 'age',
+    'weightKg': 'weight_kg',
+    'visitIdentifier': 'visit_type',
+    'modality': 'modality',
+    'dateAcquired': 'scan_date',
+    'seriesIdentifier': 'series_id',
+    'processedDataLabel': 'processing_label',
+}
+
+# Default values for fields always present in the output (column order)
+_METADATA_DEFAULTS = {
+    'subject_id': 'N/A',
+    'research_group': 'N/A',
+    'gender': 'N/A',
+    'age': None,
+    'weight_kg': None,
+    'apoe_a1': None,
+    'apoe_a2': None,
+    'visit_type': 'N/A',
+    'modality': 'N/A',
+    'scan_date': 'N/A',
+    'series_id': 'N/A',
+}
+
+
+# Clinical assessments: name -> (metadata key, assessmentScore attribute)
+_ASSESSMENT_MAP = {
+    'MMSE': ('mmse_score', 'MMSCORE'),
+    'CDR': ('cdr_score', 'CDGLOBAL'),
+    'NPI': ('npi_score', 'NPISCORE'),
+    'FAQ': ('faq_score', 'FAQTOTAL'),
+}
+
+# Protocol terms: term -> (metadata key, enclosing element).
+# MRI terms are read from protocolTerm/protocol and PET terms from any
+# protocol below imagingProtocol; term names are unique across both.
+_PROTOCOL_MAP = {
+    # MRI protocol information
+    'TE': ('te_ms', 'protocolTerm'),
+    'TR': ('tr_ms', 'protocolTerm'),
+    'Slice Thickness': ('slice_thickness_mm', 'protocolTerm'),
+    'Flip Angle': ('flip_angle', 'protocolTerm'),
+    'Manufacturer': ('manufacturer', 'protocolTerm'),
+    'Mfg Model': ('device_model', 'protocolTerm'),
+    'Field Strength': ('field_strength_t', 'protocolTerm'),
+    # PET specific protocol information
+    'Radiopharmaceutical': ('radiopharmaceutical', 'imagingProtocol'),
+    'Number of Rows': ('num_rows', 'imagingProtocol'),
+    'Number of Columns': ('num_columns', 'imagingProtocol'),
+    'Number of Slices': ('num_slices', 'imagingProtocol'),
+    'Pixel Spacing X': ('pixel_spacing_x', 'imagingProtocol'),
+    'Pixel Spacing Y': ('pixel_spacing_y', 'imagingProtocol'),
+    'Reconstruction': ('reconstruction_method', 'imagingProtocol'),
+}
+
+# Columns parsed as raw text and converted to numbers once per DataFrame
+_NUMERIC_COLUMNS = (
+    'age', 'weight_kg',
+    'mmse_score', 'cdr_score', 'npi_score', 'faq_score',
+    'te_ms', 'tr_ms', 'slice_thickness_mm', 'flip_angle', 'field_strength_t',
+    'num_rows', 'num_columns', 'num_slices',
+    'pixel_spacing_x', 'pixel_spacing_y',
+)
+
+# Container elements whose nesting decides how <protocol> is read
+_CONTEXT_TAGS = frozenset(('protocolTerm', 'imagingProtocol'))
+
+# Number of files sent to a worker process at a time
+_PARSE_CHUNKSIZE = 64
+
+# Threads per worker process reading files ahead of parsing
+_READER_THREADS = 4
+
+# Research groups counted in the scan type summary (sheet column order)
+_SUMMARY_GROUPS = ('AD', 'MCI', 'CN')
+
+# lxml parser options (the stdlib fallback takes no options)
+_PARSER_OPTIONS = {
+    'remove_blank_text': True,
+    'resolve_entities': False,
+    'collect_ids': False,
+    'huge_tree': False,
+}
+
+# Bytes fed to the pull parser at a time
+_FEED_BLOCK_SIZE = 64 * 1024
+
+# lxml pull parser reused for every file parsed in this process
+_PARSER = None
+
+
+def _get_xml_parser():
+    """
+    Return the process-wide lxml pull parser, creating it on first use.
+    
+    lxml parsers can be reused after close(), so one parser context
+    serves every file. The parser is not thread-safe.
+    
+    Returns:
+        XMLPullParser: Reusable lxml pull parser
+    """
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = ET.XMLPullParser(events=('start', 'end'), 
+                                   **_PARSER_OPTIONS)
+    return _PARSER
+
+
+def _iter_xml_events(xml_data):
+    """
+    Parse an in-memory XML document into (event, element) pairs.
+    
+    The data is fed to the parser in blocks and the events of each block
+    are yielded before the next one is fed, so elements can be cleared
+    while the rest of the document is still unparsed.
+    
+    Args:
+        xml_data (bytes): XML document
+        
+    Yields:
+        tuple: (event, element) pairs for 'start' and 'end' events
+    """
+    if not HAS_LXML:
+        yield from ET.iterparse(io.BytesIO(xml_data), events=('start', 'end'))
+        return
+    
+    parser = _get_xml_parser()
+    
+    # Drop events left over from a document that failed to parse
+    for _ in parser.read_events():
+        pass
+    
+    finished = False
+    try:
+        for offset in range(0, len(xml_data), _FEED_BLOCK_SIZE):
+            parser.feed(xml_data[offset:offset + _FEED_BLOCK_SIZE])
+            yield from parser.read_events()
+        
+        finished = True
+        # close() resets the parser, also when it raises for bad documents
+        parser.close()
+        yield from parser.read_events()
+    finally:
+        if not finished:
+            # Parsing failed or was abandoned; reset for the next document
+            try:
+                parser.close()
+            except ET.XMLSyntaxError:
+                pass
+
+
+@lru_cache(maxsize=100000)
+def _classify(filename):
+    """
+    Classify a scan type from an XML file basename.
+    
+    Cached on the basename only, so the same acquisition name seen in
+    different subject folders is classified once.
+    
+    Args:
+        filename (str): XML file basename
+        
+    Returns:
+        str: Scan type identifier
+    """
+    # Substring tests in priority order; for names this short they are
+    # faster in CPython than a regex pass over the filename.
+    # PET scan type matching
+    if "FDG" in filename:
+        return "PET_FDG"
+    elif "FBB" in filename or "Florbetaben" in filename:
+        return "PET_FBB"  
+    elif "AV45" in filename or "florbetapir" in filename:
+        return "PET_AV45"
+    elif ("Tau" in filename or "AV1451" in filename or 
+          "FLORTAUCIPIR" in filename):
+        return "PET_TAU"
+    elif "PET" in filename:
+        return "PET_OTHER"
+    
+    # MRI scan type matching
+    elif "MPR" in filename:
+        if "FLAIR" in filename:
+            return "MRI_FLAIR"
+        else:
+            return "MRI_MPRAGE"
+    elif "FLAIR" in filename:
+        return "MRI_FLAIR"
+    elif "DTI" in filename:
+        return "MRI_DTI"
+    elif "fMRI" in filename:  # also covers rsfMRI
+        return "MRI_fMRI"
+    elif "ASL" in filename:
+        return "MRI_ASL"
+    elif "T2" in filename:
+        return "MRI_T2"
+    else:
+        return "OTHER"
+
+
+def _row_count(columns):
+    """
+    Return the number of rows stored in a column dictionary.
+    
+    Args:
+        columns (dict): Column name -> list of values
+        
+    Returns:
+        int: Number of rows
+    """
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def _append_row(columns, metadata):
+    """
+    Append one metadata record to column-oriented storage.
+    
+    Columns first seen in this record are back-filled with None, and
+    existing columns missing from the record get None appended, so all
+    columns keep the same length.
+    
+    Args:
+        columns (dict): Column name -> list of values
+        metadata (dict): Extracted metadata of one file
+    """
+    n_rows = _row_count(columns)
+    
+    for key, value in metadata.items():
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = [None] * n_rows
+        column.append(value)
+    
+    if len(metadata) < len(columns):
+        for column in columns.values():
+            if len(column) == n_rows:
+                column.append(None)
+
 
 class ADNIDetailedMetadataExtractor:
     """ADNI metadata detailed extractor for XML files."""
@@ -38,8 +298,25 @@ class ADNIDetailedMetadataExtractor:
             base_path (str): Base directory path containing ADNI metadata
         """
         self.base_path = Path(base_path)
-        self.scan_type_data = defaultdict(list)
+        # Column-oriented storage: scan type -> {column name: values}
+        self.scan_type_data = defaultdict(dict)
         self.namespace = None  # No namespace usage
+        self._all_folder_names = None  # Cached for folder suggestions
+        
+        # Element handlers for parse_xml_metadata, keyed by XML tag
+        self._start_handlers = {
+            'assessment': self._start_assessment,
+            'provenanceDetail': self._start_provenance_detail,
+        }
+        self._end_handlers = {
+            'subjectInfo': self._extract_apoe_info,
+            'assessmentScore': self._extract_clinical_scores,
+            'assessment': self._end_assessment,
+            'protocol': self._extract_imaging_protocol,
+            'process': self._extract_provenance_field,
+            'program': self._extract_provenance_field,
+            'provenanceDetail': self._extract_processing_info,
+        }
         
     def extract_scan_type(self, xml_file_path):
         """
@@ -51,117 +328,85 @@ class ADNIDetailedMetadataExtractor:
         Returns:
             str: Scan type identifier
         """
-        filename = os.path.basename(xml_file_path)
-        
-        # PET scan type matching
-        if "FDG" in filename:
-            return "PET_FDG"
-        elif "FBB" in filename or "Florbetaben" in filename:
-            return "PET_FBB"  
-        elif "AV45" in filename or "florbetapir" in filename:
-            return "PET_AV45"
-        elif ("Tau" in filename or "AV1451" in filename or 
-              "FLORTAUCIPIR" in filename):
-            return "PET_TAU"
-        elif "PET" in filename:
-            return "PET_OTHER"
-        
-        # MRI scan type matching
-        elif "MPR" in filename:
-            if "FLAIR" in filename:
-                return "MRI_FLAIR"
-            else:
-                return "MRI_MPRAGE"
-        elif "FLAIR" in filename:
-            return "MRI_FLAIR"
-        elif "DTI" in filename:
-            return "MRI_DTI"
-        elif "rsfMRI" in filename or "fMRI" in filename:
-            return "MRI_fMRI"
-        elif "ASL" in filename:
-            return "MRI_ASL"
-        elif "T2" in filename:
-            return "MRI_T2"
-        else:
-            return "OTHER"
+        return _classify(os.path.basename(xml_file_path))
     
-    def parse_xml_metadata(self, xml_file_path):
+    def parse_xml_metadata(self, xml_file_path, scan_type=None, 
+                           xml_data=None):
         """
         Parse metadata from XML file.
         
+        The document is parsed incrementally; each element is dispatched on
+        its tag as it starts/ends and cleared right after, so only a small
+        part of the tree is held at a time. With lxml, one pull parser is
+        reused for all files of the process.
+        
         Args:
             xml_file_path (Path): Path to XML file
+            scan_type (str, optional): Scan type if already known;
+                detected from the filename otherwise
+            xml_data (bytes, optional): File contents if already read;
+                the file is read from xml_file_path otherwise
             
         Returns:
             dict: Extracted metadata or None if parsing fails
         """
         try:
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
+            # Extract basic information
+            metadata = {
+                'filename': os.path.basename(xml_file_path),
+                'scan_type': (scan_type or 
+                              self.extract_scan_type(xml_file_path)),
+            }
+            metadata.update(_METADATA_DEFAULTS)
             
-            metadata = {}
+            state = {
+                'found_fields': set(),
+                'context': defaultdict(int),
+                'assessment': None,
+                'provenance': None,
+                'processing_steps': [],
+            }
+            start_handlers = self._start_handlers
+            end_handlers = self._end_handlers
             
-            # Extract basic information
-            metadata['filename'] = os.path.basename(xml_file_path)
-            metadata['scan_type'] = self.extract_scan_type(xml_file_path)
-            
-            # Subject information
-            subject_id = root.find('.//subjectIdentifier')
-            metadata['subject_id'] = (subject_id.text 
-                                    if subject_id is not None else 'N/A')
-            
-            research_group = root.find('.//researchGroup')
-            metadata['research_group'] = (research_group.text 
-                                        if research_group is not None 
-                                        else 'N/A')
-            
-            subject_sex = root.find('.//subjectSex')
-            metadata['gender'] = (subject_sex.text 
-                                if subject_sex is not None else 'N/A')
-            
-            subject_age = root.find('.//subjectAge')
-            metadata['age'] = (float(subject_age.text) 
-                             if subject_age is not None else None)
-            
-            weight = root.find('.//weightKg')
-            metadata['weight_kg'] = (float(weight.text) 
-                                   if weight is not None else None)
-            
-            # APOE genotype information
-            apoe_elements = root.findall('.//subjectInfo[@item]')
-            for apoe in apoe_elements:
-                item = apoe.get('item')
-                if 'APOE A1' in item:
-                    metadata['apoe_a1'] = apoe.text
-                elif 'APOE A2' in item:
-                    metadata['apoe_a2'] = apoe.text
-            
-            # Visit information
-            visit_id = root.find('.//visitIdentifier')
-            metadata['visit_type'] = (visit_id.text 
-                                    if visit_id is not None else 'N/A')
-            
-            # Scan information
-            modality = root.find('.//modality')
-            metadata['modality'] = (modality.text 
-                                  if modality is not None else 'N/A')
-            
-            date_acquired = root.find('.//dateAcquired')
-            metadata['scan_date'] = (date_acquired.text 
-                                   if date_acquired is not None else 'N/A')
-            
-            series_id = root.find('.//seriesIdentifier')
-            metadata['series_id'] = (series_id.text 
-                                   if series_id is not None else 'N/A')
-            
-            # Extract clinical assessment scores
-            self._extract_clinical_scores(root, metadata)
-            
-            # Extract imaging protocol information
-            self._extract_imaging_protocol(root, metadata)
-            
-            # Extract processing information (for MRI)
-            self._extract_processing_info(root, metadata)
+            if xml_data is None:
+                xml_data = Path(xml_file_path).read_bytes()
+            
+            # closing() resets the shared parser if parsing stops early
+            with closing(_iter_xml_events(xml_data)) as context:
+                for event, elem in context:
+                    tag = elem.tag
+                    
+                    if event == 'start':
+                        if tag in _CONTEXT_TAGS:
+                            state['context'][tag] += 1
+                        handler = start_handlers.get(tag)
+                        if handler is not None:
+                            handler(elem, metadata, state)
+                        continue
+                    
+                    key = _TEXT_FIELDS.get(tag)
+                    if key is not None:
+                        # Keep the first occurrence, as root.find() did
+                        if key not in state['found_fields']:
+                            state['found_fields'].add(key)
+                            metadata[key] = elem.text
+                    else:
+                        handler = end_handlers.get(tag)
+                        if handler is not None:
+                            handler(elem, metadata, state)
+                        if tag in _CONTEXT_TAGS:
+                            state['context'][tag] -= 1
+                    
+                    # Release the finished subtree and its emptied siblings
+                    elem.clear()
+                    if HAS_LXML:
+                        while elem.getprevious() is not None:
+                            del elem.getparent()[0]
+            
+            processing_steps = state['processing_steps']
+            metadata['processing_steps'] = ('; '.join(processing_steps) 
+                                          if processing_steps else 'N/A')
             
             return metadata
             
@@ -169,150 +414,180 @@ class ADNIDetailedMetadataExtractor:
             logger.error(f"XML parsing error ({xml_file_path}): {e}")
             return None
     
-    def _extract_clinical_scores(self, root, metadata):
+    def _extract_apoe_info(self, subject_info, metadata, state):
         """
-        Extract clinical assessment scores from XML.
+        Extract APOE genotype information from a subjectInfo element.
         
         Args:
-            root: XML root element
+            subject_info: subjectInfo XML element
             metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
         """
-        assessments = root.findall('.//assessment')
+        item = subject_info.get('item', '')
         
-        for assessment in assessments:
-            name = assessment.get('name', '')
-            
-            if 'MMSE' in name:
-                score = assessment.find('.//assessmentScore[@attribute="MMSCORE"]')
-                metadata['mmse_score'] = (float(score.text) 
-                                        if score is not None else None)
-                
-            elif 'CDR' in name:
-                score = assessment.find('.//assessmentScore[@attribute="CDGLOBAL"]')
-                metadata['cdr_score'] = (float(score.text) 
-                                       if score is not None else None)
-                
-            elif 'NPI' in name:
-                score = assessment.find('.//assessmentScore[@attribute="NPISCORE"]')
-                metadata['npi_score'] = (float(score.text) 
-                                       if score is not None else None)
-                
-            elif 'FAQ' in name:
-                score = assessment.find('.//assessmentScore[@attribute="FAQTOTAL"]')
-                metadata['faq_score'] = (float(score.text) 
-                                       if score is not None else None)
+        if 'APOE A1' in item:
+            metadata['apoe_a1'] = subject_info.text
+        elif 'APOE A2' in item:
+            metadata['apoe_a2'] = subject_info.text
     
-    def _extract_imaging_protocol(self, root, metadata):
+    def _start_assessment(self, assessment, metadata, state):
         """
-        Extract imaging protocol information from XML.
+        Select the score to look for inside an assessment element.
         
         Args:
-            root: XML root element
+            assessment: assessment XML element
             metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
         """
-        # MRI protocol information
-        protocol_terms = root.findall('.//protocolTerm/protocol')
-        
-        for protocol in protocol_terms:
-            term = protocol.get('term', '')
-            
-            if term == 'TE':
-                metadata['te_ms'] = (float(protocol.text) 
-                                   if protocol.text else None)
-            elif term == 'TR':
-                metadata['tr_ms'] = (float(protocol.text) 
-                                   if protocol.text else None)
-            elif term == 'Slice Thickness':
-                metadata['slice_thickness_mm'] = (float(protocol.text) 
-                                                if protocol.text else None)
-            elif term == 'Flip Angle':
-                metadata['flip_angle'] = (float(protocol.text) 
-                                        if protocol.text else None)
-            elif term == 'Manufacturer':
-                metadata['manufacturer'] = protocol.text
-            elif term == 'Mfg Model':
-                metadata['device_model'] = protocol.text
-            elif term == 'Field Strength':
-                metadata['field_strength_t'] = (float(protocol.text) 
-                                               if protocol.text else None)
-        
-        # PET specific protocol information
-        pet_protocols = root.findall('.//imagingProtocol//protocol')
-        for protocol in pet_protocols:
-            term = protocol.get('term', '')
-            
-            if term == 'Radiopharmaceutical':
-                metadata['radiopharmaceutical'] = protocol.text
-            elif term == 'Number of Rows':
-                metadata['num_rows'] = (int(float(protocol.text)) 
-                                      if protocol.text else None)
-            elif term == 'Number of Columns':
-                metadata['num_columns'] = (int(float(protocol.text)) 
-                                         if protocol.text else None)
-            elif term == 'Number of Slices':
-                metadata['num_slices'] = (int(float(protocol.text)) 
-                                        if protocol.text else None)
-            elif term == 'Pixel Spacing X':
-                metadata['pixel_spacing_x'] = (float(protocol.text) 
-                                             if protocol.text else None)
-            elif term == 'Pixel Spacing Y':
-                metadata['pixel_spacing_y'] = (float(protocol.text) 
-                                             if protocol.text else None)
-            elif term == 'Reconstruction':
-                metadata['reconstruction_method'] = protocol.text
-    
-    def _extract_processing_info(self, root, metadata):
-        """
-        Extract processing information from XML.
+        name = assessment.get('name', '')
+        
+        # Exact name lookup first, then the substring match (e.g. 'NPI-Q')
+        spec = _ASSESSMENT_MAP.get(name)
+        if spec is None:
+            spec = next((spec for token, spec in _ASSESSMENT_MAP.items() 
+                         if token in name), None)
+            if spec is None:
+                return
+        
+        key = spec[0]
+        metadata[key] = None
+        state['assessment'] = spec
+    
+    def _extract_clinical_scores(self, score, metadata, state):
+        """
+        Extract clinical assessment score from an assessmentScore element.
         
         Args:
-            root: XML root element
+            score: assessmentScore XML element
             metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
         """
-        processed_label = root.find('.//processedDataLabel')
-        if processed_label is not None:
-            metadata['processing_label'] = processed_label.text
+        if state['assessment'] is None:
+            return
         
-        # Processing steps
-        provenance_details = root.findall('.//provenanceDetail')
-        processing_steps = []
+        key, attribute = state['assessment']
+        if score.get('attribute') == attribute:
+            metadata[key] = score.text
+            # Only the first matching score of an assessment is used
+            state['assessment'] = None
+    
+    def _end_assessment(self, assessment, metadata, state):
+        """
+        Reset the assessment context when an assessment element ends.
         
-        for detail in provenance_details:
-            process = detail.find('.//process')
-            program = detail.find('.//program')
-            
-            if process is not None and program is not None:
-                processing_steps.append(f"{process.text}({program.text})")
+        Args:
+            assessment: assessment XML element
+            metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
+        """
+        state['assessment'] = None
+    
+    def _extract_imaging_protocol(self, protocol, metadata, state):
+        """
+        Extract imaging protocol information from a protocol element.
         
-        metadata['processing_steps'] = ('; '.join(processing_steps) 
-                                      if processing_steps else 'N/A')
+        Args:
+            protocol: protocol XML element
+            metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
+        """
+        spec = _PROTOCOL_MAP.get(protocol.get('term'))
+        if spec is None:
+            return
+        
+        key, context_tag = spec
+        if state['context'][context_tag]:
+            metadata[key] = protocol.text
+    
+    def _start_provenance_detail(self, detail, metadata, state):
+        """
+        Open a new processing step when a provenanceDetail element starts.
+        
+        Args:
+            detail: provenanceDetail XML element
+            metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
+        """
+        state['provenance'] = {}
+    
+    def _extract_provenance_field(self, elem, metadata, state):
+        """
+        Record the process/program text of the current provenanceDetail.
+        
+        Args:
+            elem: process or program XML element
+            metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
+        """
+        if state['provenance'] is not None:
+            state['provenance'].setdefault(elem.tag, elem.text)
+    
+    def _extract_processing_info(self, detail, metadata, state):
+        """
+        Extract a processing step when a provenanceDetail element ends.
+        
+        Args:
+            detail: provenanceDetail XML element
+            metadata (dict): Dictionary to store extracted metadata
+            state (dict): Parsing state of the current file
+        """
+        step = state['provenance']
+        state['provenance'] = None
+        
+        if step is not None and 'process' in step and 'program' in step:
+            state['processing_steps'].append(
+                f"{step['process']}({step['program']})")
     
     def _find_xml_folders(self, base_dir):
         """
         Recursively find folders containing XML files.
         
+        Directories are read once with os.scandir, and the XML files seen
+        are returned with each folder so they need not be listed again.
+        Yielded folders exist by construction; a missing base_dir simply
+        yields nothing.
+        
         Args:
             base_dir (Path): Base directory to search
             
-        Returns:
-            list: List of Path objects containing XML files
+        Yields:
+            tuple: (folder Path, list of XML file Paths), parents before
+                children
         """
-        xml_folders = []
-        base_path = Path(base_dir)
+        yield from self._scan_xml_folders(Path(base_dir))
+    
+    def _scan_xml_folders(self, folder):
+        """
+        Scan one folder and recurse into its subfolders.
         
-        if not base_path.exists():
-            return xml_folders
+        Args:
+            folder (Path): Folder to scan
+            
+        Yields:
+            tuple: (folder Path, list of XML file Paths)
+        """
+        xml_files = []
+        subfolders = []
         
         try:
-            for root, dirs, files in os.walk(base_path):
-                xml_files = [f for f in files if f.endswith('.xml')]
-                if xml_files:
-                    xml_folders.append(Path(root))
-            
-            return xml_folders
-        except Exception as e:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif name.endswith('.xml'):
+                        xml_files.append(folder / name)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        except OSError as e:
             logger.warning(f"Error during folder exploration: {e}")
-            return xml_folders
+            return
+        
+        if xml_files:
+            yield folder, xml_files
+        
+        for subfolder in subfolders:
+            yield from self._scan_xml_folders(Path(subfolder))
     
     def _resolve_folder_path(self, folder_input):
         """
@@ -344,31 +619,59 @@ class ADNIDetailedMetadataExtractor:
         
         return resolved_path  # Return even if doesn't exist
     
+    def _get_folder_names(self):
+        """
+        List candidate folder names for suggestions, scanning only once.
+        
+        Returns:
+            list: (suggested name, lowercase folder name) tuples
+        """
+        if self._all_folder_names is None:
+            folder_names = []
+            search_dirs = [
+                (self.base_path / "Metainformation", "Metainformation/"),
+                (self.base_path, ""),
+            ]
+            
+            for search_dir, prefix in search_dirs:
+                try:
+                    with os.scandir(search_dir) as entries:
+                        folder_names.extend(
+                            (f"{prefix}{entry.name}", entry.name.lower())
+                            for entry in entries if entry.is_dir())
+                except OSError:
+                    continue
+            
+            self._all_folder_names = folder_names
+        
+        return self._all_folder_names
+    
     def _suggest_similar_folders(self, target_folder_name):
         """
         Find and suggest similar folder names.
         
+        Folders containing the target name come first, followed by close
+        matches from difflib (e.g. for typos).
+        
         Args:
             target_folder_name (str): Target folder name to find similar ones
             
         Returns:
             list: List of suggested folder names
         """
-        suggestions = []
+        target = target_folder_name.lower()
+        folder_names = self._get_folder_names()
         
-        # Find similar folders in Metainformation directory
-        metainfo_path = self.base_path / "Metainformation"
-        if metainfo_path.exists():
-            for item in metainfo_path.iterdir():
-                if (item.is_dir() and 
-                    target_folder_name.lower() in item.name.lower()):
-                    suggestions.append(f"Metainformation/{item.name}")
+        suggestions = [suggestion for suggestion, name in folder_names 
+                       if target in name]
         
-        # Find similar folders in root
-        for item in self.base_path.iterdir():
-            if (item.is_dir() and 
-                target_folder_name.lower() in item.name.lower()):
-                suggestions.append(item.name)
+        # Close matches, best first
+        close_matches = difflib.get_close_matches(
+            target, [name for _, name in folder_names], n=5, cutoff=0.6)
+        for match in close_matches:
+            suggestions.extend(suggestion for suggestion, name in folder_names 
+                               if name == match 
+                               and suggestion not in suggestions)
         
         return suggestions
 
@@ -400,7 +703,7 @@ class ADNIDetailedMetadataExtractor:
                 folder_path = self._resolve_folder_path(folder_input)
                 
                 # Check for XML files
-                xml_folders = self._find_xml_folders(folder_path)
+                xml_folders = list(self._find_xml_folders(folder_path))
                 
                 if xml_folders:
                     folders_to_process.extend(xml_folders)
@@ -433,62 +736,117 @@ class ADNIDetailedMetadataExtractor:
             
             # Search Metainformation folder
             metainfo_path = self.base_path / "Metainformation"
-            if metainfo_path.exists():
-                folders_to_process.extend(self._find_xml_folders(metainfo_path))
+            folders_to_process.extend(self._find_xml_folders(metainfo_path))
             
             # Search other metadata folders
             for folder_name in ["ADNI_PET_metadata", "ADNI_MRI_metadata"]:
                 folder_path = self.base_path / folder_name
-                if folder_path.exists():
-                    folders_to_process.extend(self._find_xml_folders(folder_path))
+                folders_to_process.extend(self._find_xml_folders(folder_path))
             
             logger.info(f"Auto search result: {len(folders_to_process)} folders found")
         
         processed_count = 0
         
-        for folder in folders_to_process:
-            if not folder.exists():
-                logger.warning(f"Folder does not exist: {folder}")
-                continue
+        # Parse files in parallel, within the file limits
+        for scan_type, metadata in self._parse_folders(folders_to_process, 
+                                                       max_files_per_type):
+            _append_row(self.scan_type_data[scan_type], metadata)
+            processed_count += 1
             
-            logger.info(f"Processing folder: {folder}")
-            
-            # Find XML files
-            xml_files = list(folder.glob("*.xml"))
-            logger.info(f"XML files found: {len(xml_files)}")
+            if processed_count % 100 == 0:
+                logger.info(f"Processing completed: {processed_count} files")
+        
+        logger.info(f"Total processed files: {processed_count}")
+        logger.info(f"Scan types found: {list(self.scan_type_data.keys())}")
+        
+        for scan_type, columns in self.scan_type_data.items():
+            logger.info(f"  {scan_type}: {_row_count(columns)} files")
+    
+    def _parse_folders(self, folders_to_process, max_files_per_type):
+        """
+        Parse the XML files of the given folders within the file limits.
+        
+        Files are selected in folder and file order, up to
+        max_files_per_type successfully parsed files per scan type in each
+        folder and ten times that in total, and parsed in parallel rounds.
+        Selection assumes that the selected files parse; when some fail,
+        the next round parses the files that take their place, so files
+        that fail to parse never count towards the limits.
+        
+        Args:
+            folders_to_process (list): (folder, XML file list) tuples
+            max_files_per_type (int): Maximum files per scan type in each
+                folder; None means unlimited
             
-            # Limit files by scan type
-            type_counts = defaultdict(int)
+        Yields:
+            tuple: (scan_type, metadata) for each successfully parsed file,
+                in file order within each round
+        """
+        max_total = (None if max_files_per_type is None 
+                     else max_files_per_type * 10)
+        remaining_folders = iter(folders_to_process)
+        # (xml_files, scan_types, outcomes) of the folders reached so far;
+        # an outcome is None until the file is parsed, then True/False
+        folders = []
+        parsed_count = 0
+        
+        while True:
+            tasks = []
+            selected_count = 0
+            folder_index = 0
             
-            for xml_file in xml_files:
-                # Check total file limit (None means unlimited)
-                if (max_files_per_type is not None and 
-                    processed_count >= max_files_per_type * 10):
-                    logger.info(f"Maximum processing files reached: {processed_count}")
-                    break
+            while max_total is None or selected_count < max_total:
+                if folder_index == len(folders):
+                    entry = next(remaining_folders, None)
+                    if entry is None:
+                        break
+                    
+                    folder, xml_files = entry
+                    logger.info(f"Processing folder: {folder}")
+                    logger.info(f"XML files found: {len(xml_files)}")
+                    
+                    # The basename is all the classifier needs
+                    folders.append((xml_files, 
+                                    [_classify(f.name) for f in xml_files], 
+                                    [None] * len(xml_files)))
                 
-                scan_type = self.extract_scan_type(str(xml_file))
+                xml_files, scan_types, outcomes = folders[folder_index]
+                type_counts = defaultdict(int)
                 
-                # Check scan type file limit (None means unlimited)
-                if (max_files_per_type is not None and 
-                    type_counts[scan_type] >= max_files_per_type):
-                    continue
-                
-                metadata = self.parse_xml_metadata(xml_file)
+                for file_index, scan_type in enumerate(scan_types):
+                    if (max_total is not None and 
+                        selected_count >= max_total):
+                        break
+                    
+                    outcome = outcomes[file_index]
+                    if outcome is False:
+                        continue
+                    
+                    if outcome is None:
+                        # Check scan type file limit (None means unlimited)
+                        if (max_files_per_type is not None and 
+                            type_counts[scan_type] >= max_files_per_type):
+                            continue
+                        tasks.append((folder_index, file_index))
+                    
+                    type_counts[scan_type] += 1
+                    selected_count += 1
                 
+                folder_index += 1
+            
+            if not tasks:
+                break
+            
+            results = _parse_files([(folders[f][0][i], folders[f][1][i]) 
+                                    for f, i in tasks])
+            for (f, i), (scan_type, metadata) in zip(tasks, results):
+                folders[f][2][i] = bool(metadata)
                 if metadata:
-                    self.scan_type_data[scan_type].append(metadata)
-                    type_counts[scan_type] += 1
-                    processed_count += 1
-                    
-                    if processed_count % 100 == 0:
-                        logger.info(f"Processing completed: {processed_count} files")
-        
-        logger.info(f"Total processed files: {processed_count}")
-        logger.info(f"Scan types found: {list(self.scan_type_data.keys())}")
+                    parsed_count += 1
+                    yield scan_type, metadata
         
-        for scan_type, data in self.scan_type_data.items():
-            logger.info(f"  {scan_type}: {len(data)} files")
+        if max_total is not None and parsed_count >= max_total:
+            logger.info(f"Maximum processing files reached: {parsed_count}")
     
     def create_detailed_excel(self, output_file=None):
         """
@@ -511,57 +869,197 @@ class ADNIDetailedMetadataExtractor:
             return None
         
         try:
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                # Create sheet for each scan type
-                for scan_type, data_list in self.scan_type_data.items():
-                    if not data_list:
-                        continue
-                    
-                    df = pd.DataFrame(data_list)
-                    
-                    # Sheet name length limit (Excel limitation)
-                    sheet_name = scan_type[:31]
-                    
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    
-                    logger.info(f"Sheet '{sheet_name}' created: {len(df)} rows")
+            # Create sheet for each scan type
+            scan_type_frames = {}
+            for scan_type, columns in self.scan_type_data.items():
+                if not columns:
+                    continue
                 
-                # Create summary sheet
-                summary_data = []
-                for scan_type, data_list in self.scan_type_data.items():
-                    # Calculate average age safely
-                    ages = [d['age'] for d in data_list if d.get('age')]
-                    avg_age = round(sum(ages) / len(ages), 1) if ages else 'N/A'
-                    
-                    # Calculate male ratio
-                    male_count = sum(1 for d in data_list 
-                                   if d.get('gender') == 'M')
-                    male_ratio = (f"{male_count / len(data_list) * 100:.1f}%" 
-                                if data_list else 'N/A')
-                    
-                    summary_data.append({
-                        'scan_type': scan_type,
-                        'data_count': len(data_list),
-                        'average_age': avg_age,
-                        'male_ratio': male_ratio,
-                        'ad_patients': sum(1 for d in data_list 
-                                         if d.get('research_group') == 'AD'),
-                        'mci_patients': sum(1 for d in data_list 
-                                          if d.get('research_group') == 'MCI'),
-                        'cn_patients': sum(1 for d in data_list 
-                                         if d.get('research_group') == 'CN'),
-                    })
+                df = pd.DataFrame(columns)
                 
-                df_summary = pd.DataFrame(summary_data)
-                df_summary.to_excel(writer, sheet_name='scan_type_summary', 
-                                  index=False)
+                # Numeric fields are kept as raw text while parsing and
+                # converted here in one vectorized pass (invalid -> NaN)
+                numeric_columns = [column for column in _NUMERIC_COLUMNS 
+                                   if column in df.columns]
+                df[numeric_columns] = df[numeric_columns].apply(
+                    pd.to_numeric, errors='coerce')
                 
+                scan_type_frames[scan_type] = df
+            
+            # Sheet name length limit (Excel limitation)
+            sheets = {scan_type[:31]: df 
+                      for scan_type, df in scan_type_frames.items()}
+            
+            # Create summary sheet from the cached DataFrames
+            summary_data = [self._summarize_scan_type(scan_type, df)
+                            for scan_type, df in scan_type_frames.items()]
+            sheets['scan_type_summary'] = pd.DataFrame(summary_data)
+            
+            self._write_workbook(output_file, sheets)
+            
         except Exception as e:
             logger.error(f"Excel file creation error: {e}")
             return None
         
         logger.info(f"Detailed Excel file created: {output_file}")
         return output_file
+    
+    def _write_workbook(self, output_file, sheets):
+        """
+        Write DataFrames to an Excel workbook in streaming mode.
+        
+        Uses xlsxwriter when installed, otherwise an openpyxl write-only
+        workbook; both write rows out without keeping an editable
+        in-memory model of the whole workbook.
+        
+        Args:
+            output_file (str): Output Excel filename
+            sheets (dict): Sheet name -> DataFrame, in sheet order
+        """
+        if HAS_XLSXWRITER:
+            with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+                    logger.info(f"Sheet '{sheet_name}' created: {len(df)} rows")
+            return
+        
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.create_sheet(title=sheet_name)
+            worksheet.append(list(df.columns))
+            
+            # Convert once to plain Python rows with None for missing values
+            rows = df.astype(object).where(df.notna(), None)
+            for row in rows.itertuples(index=False, name=None):
+                worksheet.append(row)
+            
+            logger.info(f"Sheet '{sheet_name}' created: {len(df)} rows")
+        
+        workbook.save(output_file)
+    
+    def _summarize_scan_type(self, scan_type, df):
+        """
+        Compute summary statistics for one scan type.
+        
+        Args:
+            scan_type (str): Scan type identifier
+            df (DataFrame): Metadata of all files of this scan type
+            
+        Returns:
+            dict: Summary row for the scan type summary sheet
+        """
+        # Average age, ignoring missing (and zero) ages
+        ages = df['age']
+        mean_age = ages[ages != 0].mean()
+        
+        male_fraction = df['gender'].eq('M').mean()
+        
+        group_counts = df['research_group'].value_counts()
+        n_ad, n_mci, n_cn = (group_counts.get(group, 0) 
+                             for group in _SUMMARY_GROUPS)
+        
+        avg_age = round(mean_age, 1) if pd.notna(mean_age) else 'N/A'
+        
+        return {
+            'scan_type': scan_type,
+            'data_count': len(df),
+            'average_age': avg_age,
+            'male_ratio': f"{male_fraction * 100:.1f}%",
+            'ad_patients': int(n_ad),
+            'mci_patients': int(n_mci),
+            'cn_patients': int(n_cn),
+        }
+
+
+# Extractor used inside parse worker processes (created once per process)
+_worker_extractor = None
+
+# Reader threads of a parse worker process (created once per process)
+_worker_reader = None
+
+
+def _init_worker():
+    """Set up the extractor, XML parser and file readers of a parse worker."""
+    global _worker_extractor, _worker_reader
+    _worker_extractor = ADNIDetailedMetadataExtractor()
+    _worker_reader = ThreadPoolExecutor(max_workers=_READER_THREADS)
+    if HAS_LXML:
+        _get_xml_parser()
+
+
+def _read_file(xml_file):
+    """
+    Read the bytes of an XML file.
+    
+    Args:
+        xml_file (Path): Path to XML file
+        
+    Returns:
+        bytes: File contents or None if the file could not be read (the
+            parser then reports the error)
+    """
+    try:
+        return xml_file.read_bytes()
+    except OSError:
+        return None
+
+
+def _parse_worker(tasks):
+    """
+    Read and parse a chunk of XML files in a worker process.
+    
+    The worker's reader threads read the chunk ahead of the parser, so
+    file reads overlap with parsing and the file contents never have to
+    be sent between processes.
+    
+    Args:
+        tasks (list): (xml_file, scan_type) tuples
+        
+    Returns:
+        list: (scan_type, metadata) tuples; metadata is None if parsing
+            fails
+    """
+    contents = _worker_reader.map(_read_file, 
+                                  [xml_file for xml_file, _ in tasks])
+    return [(scan_type, 
+             _worker_extractor.parse_xml_metadata(xml_file, scan_type, 
+                                                  xml_data))
+            for (xml_file, scan_type), xml_data in zip(tasks, contents)]
+
+
+def _parse_files(parse_tasks):
+    """
+    Parse XML files with a process pool.
+    
+    Files are sent to workers in chunks; the number of chunks in flight
+    is bounded so results cannot pile up in the pool.
+    
+    Args:
+        parse_tasks (list): (xml_file, scan_type) tuples
+        
+    Yields:
+        tuple: (scan_type, metadata) in task order
+    """
+    if not parse_tasks:
+        return
+    
+    max_workers = os.cpu_count() or 1
+    max_pending = 2 * max_workers
+    
+    with ProcessPoolExecutor(max_workers=max_workers, 
+                             initializer=_init_worker) as executor:
+        pending = deque()
+        
+        for start in range(0, len(parse_tasks), _PARSE_CHUNKSIZE):
+            chunk = parse_tasks[start:start + _PARSE_CHUNKSIZE]
+            pending.append(executor.submit(_parse_worker, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        
+        while pending:
+            yield from pending.popleft().result()
 
 
 def main():
@@ -610,8 +1108,8 @@ def main():
         
         # Print processed scan types
         print("\n📋 Generated scan type sheets:")
-        for scan_type, data in extractor.scan_type_data.items():
-            print(f"  - {scan_type}: {len(data)} subjects")
+        for scan_type, columns in extractor.scan_type_data.items():
+            print(f"  - {scan_type}: {_row_count(columns)} subjects")
     else:
         print("❌ Excel file creation failed.")
 